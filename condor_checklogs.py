@@ -9,10 +9,23 @@ from __future__ import print_function
 
 
 import sys
+import os.path as op
 import re
+import csv
+import array
+import bisect
 import argparse
 import logging
 import datetime as dt
+try:
+    from .condor_eventlog import read_events
+except (ImportError, ValueError):
+    # Run as a script rather than from the fluidcondor package.
+    from condor_eventlog import read_events
+try:
+    import numpy as np
+except ImportError:
+    np = None
 logger = logging.getLogger(__name__)
 
 RESET = "\033[0m"
@@ -24,26 +37,10 @@ OK = GREEN + 'OK' + RESET
 NO = RED + 'NO' + RESET
 
 TIME_FORMAT = '%m/%d %H:%M:%S'
-
-RE_RETURN = re.compile(r'\(([^()]+) (\d+)\)')
-RE_DATE = re.compile(r'0\d\d \([0-9.]+\) (\d+/\d+ \d+:\d+:\d+) ')
-#RE_SUBMITTED = re.compile(r'000 ')
-#RE_STARTED = re.compile(r'001 ')
-#RE_TERM = re.compile(r'005 ')
-RE_MEM = re.compile(r'^\s*Memory \(MB\)\s+:\s*(\d+)\s+(\d+)\s+(\d+)$')
-RE_MEMUPDATE = re.compile(r'^\s*(\d+)\s+-\s+MemoryUsage of job \(([A-Za-z]+)\)$')
-
-STATES = {'000 ': 'submitted',
-          '001 ': 'started',
-          '004 ': 'evicted',
-          '005 ': 'terminated',
-          '006 ': 'Image size updated',
-          '007 ': 'Shadow exception!',
-          '009 ': 'aborted',
-          '012 ': 'hold',
-          '013 ': 'released',
-          '022 ': 'disconnected',  # attempting to reconnect
-          '024 ': 'reconnection failed'}  # disconnected too long. rescheduling job
+# Also accept the ISO format, which includes the year.
+RE_DATE = re.compile(r'(?:(\d+)-)?(\d+)[/-](\d+)[ T](\d+):(\d+):(\d+)')
+# Leap year, used when the log does not give the year (so that 02/29 exists).
+EPOCH = dt.datetime(2000, 1, 1)
 
 ended = set(('evicted', 'terminated', 'aborted', 'disconnected', 'reconnection failed'))
 running = set(('submitted', 'started', 'Image size updated'))  # 'hold', 'released'
@@ -55,54 +52,44 @@ def termination_code(logfile):
     state = None
     date  = None
 
-    termination_match = None
-    memory_match = None
+    termination = None
+    memory = None
     memupdates = []  # All memory values at logged timepoints.
-    with open(logfile) as log:
-        for lineno, line in enumerate(log, start=1):
-            state_code = line[:4]
-
-            try:
-                if state_code in STATES:
-                    state = STATES.get(state_code)
-                    date = RE_DATE.match(line).group(1)
-
-                if state == 'terminated':
-                    m = RE_RETURN.search(line)
-                    if m:
-                        termination_match = m
-                    else:
-                        m = RE_MEM.match(line)
-                        if m:
-                            memory_match = m
-                    memupdates = []
-                elif state == 'evicted':
-                    m = RE_MEM.match(line)
-                    if m:
-                        memory_match = m
-                    memupdates = []
-                elif state == 'Image size updated':
-                    m = RE_MEMUPDATE.match(line)
-                    if m:
-                        memupdates.append(int(m.group(1)))
-                elif state in set(('submitted', 'started')):
-                    memory_match = None
-                    memupdates = []
-            except BaseException as err:
-                err.args += ("At line %d '%s'" % (lineno, line.rstrip()),)
-                raise
+    last = None
+    for event in read_events(logfile):
+        name = event.name
+        if name is None:
+            continue
+        state = name
+        last = event
+
+        if state == 'terminated':
+            termination = event.return_value or termination
+            memory = event.memory or memory
+            memupdates = []
+        elif state == 'evicted':
+            memory = event.memory or memory
+            memupdates = []
+        elif state == 'Image size updated':
+            memupdate = event.memory_usage
+            if memupdate is not None:
+                memupdates.append(memupdate)
+        elif state in ('submitted', 'started'):
+            memory = None
+            memupdates = []
+    if last is not None:
+        date = last.timestamp
 
     try:
-        return_type = termination_match.group(1)
-        return_value =  int(termination_match.group(2))
-    except AttributeError:
+        return_type, return_value = termination
+    except TypeError:
         if state == 'terminated':
             logger.warning('Could not match the return value code')
         return_type = None
         return_value = None
-    try:
-        memories = tuple(int(x) for x in memory_match.groups())
-    except AttributeError:
+    if memory is not None:
+        memories = memory
+    else:
         if state in ('terminated', 'evicted'):
             if return_value == 0:
                 logger.warning('Could not match the memory amounts: %s', logfile)
@@ -215,6 +202,193 @@ def check_logs(logfiles, show_all=False, terminated_only=False, memory=False,
                                                              len(logfiles)))
 
 
+def date_to_seconds(date):
+    """Seconds since EPOCH of a log date, -1 if it can't be parsed."""
+    m = RE_DATE.match(date) if date else None
+    if not m:
+        return -1
+    year = int(m.group(1)) if m.group(1) else EPOCH.year
+    month, day, hour, minute, sec = (int(x) for x in m.groups()[1:])
+    return int((dt.datetime(year, month, day, hour, minute, sec)
+                - EPOCH).total_seconds())
+
+
+def seconds_to_date(seconds):
+    """Inverse of `date_to_seconds`. The year is only shown if not EPOCH's."""
+    date = EPOCH + dt.timedelta(seconds=seconds)
+    if date.year == EPOCH.year:
+        return date.strftime(TIME_FORMAT)
+    return date.strftime('%Y-%m-%d %H:%M:%S')
+
+
+class JobTable(object):
+    """Results of `termination_code` stored as typed columns, one row per log.
+
+    Columns are `array.array` objects (viewed as NumPy arrays when installed).
+    `state`, `return_type` and `prefix` (the log directory) hold indices into
+    `self.categories`, `date` is in seconds since EPOCH, and missing values
+    are -1. `self.logfiles` only holds the basenames."""
+
+    columns = (('state', 'b'), ('date', 'i'), ('return_type', 'b'),
+               ('return_value', 'i'), ('mem_used', 'i'), ('mem_request', 'i'),
+               ('mem_alloc', 'i'), ('prefix', 'i'))
+    categorical = ('state', 'return_type', 'prefix')
+
+    def __init__(self):
+        self.logfiles = []
+        self.data = dict((col, array.array(typecode))
+                         for col, typecode in self.columns)
+        self.categories = dict((col, []) for col in self.categorical)
+        self._codes = dict((col, {}) for col in self.categorical)
+
+    def __len__(self):
+        return len(self.logfiles)
+
+    def _encode(self, col, value):
+        if value is None:
+            return -1
+        codes = self._codes[col]
+        try:
+            return codes[value]
+        except KeyError:
+            codes[value] = code = len(self.categories[col])
+            self.categories[col].append(value)
+            return code
+
+    def append(self, logfile, state, date, return_type, return_value,
+               mem_used, mem_request, mem_alloc):
+        """Add the output of `termination_code(logfile)`."""
+        seconds = date_to_seconds(date)
+        data = self.data
+        self.logfiles.append(op.basename(logfile))
+        data['state'].append(self._encode('state', state))
+        data['date'].append(seconds)
+        data['return_type'].append(self._encode('return_type', return_type))
+        data['prefix'].append(self._encode('prefix', op.dirname(logfile) or '.'))
+        for col, value in (('return_value', return_value),
+                           ('mem_used', mem_used),
+                           ('mem_request', mem_request),
+                           ('mem_alloc', mem_alloc)):
+            data[col].append(-1 if value is None else value)
+
+    def arrays(self):
+        """Columns as NumPy arrays sharing the memory of the array.array."""
+        return dict((col, np.frombuffer(arr, dtype=arr.typecode) if arr
+                          else np.zeros(0, dtype=arr.typecode))
+                    for col, arr in self.data.items())
+
+    def save(self, outfile):
+        """Write to a compressed `.npz` if `outfile` ends in .npz (needs
+        NumPy), or CSV otherwise (with the dates formatted back)."""
+        if outfile.endswith('.npz'):
+            columns = self.arrays()
+            for col in self.categorical:
+                columns[col + '_names'] = np.array(
+                        [str(c) for c in self.categories[col]])
+            logfiles = np.array([f.encode('utf-8') for f in self.logfiles],
+                                dtype='S')
+            np.savez_compressed(outfile, logfile=logfiles, **columns)
+            return
+        names = [col for col, _ in self.columns]
+        with open(outfile, 'w') as out:
+            writer = csv.writer(out, lineterminator='\n')
+            writer.writerow(['logfile'] + names)
+            for logfile, row in zip(self.logfiles,
+                                    zip(*(self.data[col] for col in names))):
+                row = [('' if v < 0 else
+                        self.categories[col][v] if col in self.categories else
+                        seconds_to_date(v) if col == 'date' else v)
+                       for col, v in zip(names, row)]
+                writer.writerow([logfile] + row)
+
+    def _state_code(self, state):
+        return self._codes['state'].get(state, -2)
+
+    def summary(self):
+        """Failure counts, memory histogram (MB, power of 2 bins), per-prefix
+        counts."""
+        terminated = self._state_code('terminated')
+        prefixes = self.categories['prefix']
+        if np is not None:
+            cols = self.arrays()
+            is_term = cols['state'] == terminated
+            failed = is_term & (cols['return_value'] != 0)
+            known = (cols['mem_used'] >= 0) & (cols['mem_alloc'] >= 0)
+            exceeded = known & (cols['mem_used'] > cols['mem_alloc'])
+            mem = cols['mem_used'][cols['mem_used'] >= 0]
+            max_mem = int(mem.max()) if mem.size else 0
+            edges = [0] + [2**k for k in range(max_mem.bit_length() + 1)]
+            hist = np.histogram(mem, bins=edges)[0].tolist()
+            per_prefix = zip(
+                np.bincount(cols['prefix'], minlength=len(prefixes)).tolist(),
+                np.bincount(cols['prefix'], weights=failed,
+                            minlength=len(prefixes)).astype(int).tolist(),
+                np.bincount(cols['prefix'], weights=exceeded,
+                            minlength=len(prefixes)).astype(int).tolist())
+            n_term, n_failed, n_exceeded = (int(is_term.sum()),
+                                            int(failed.sum()),
+                                            int(exceeded.sum()))
+        else:
+            data = self.data
+            counts = [[0, 0, 0] for _ in prefixes]
+            n_term = n_failed = n_exceeded = 0
+            mem = []
+            for state, retval, used, alloc, prefix in zip(
+                    data['state'], data['return_value'], data['mem_used'],
+                    data['mem_alloc'], data['prefix']):
+                counts[prefix][0] += 1
+                if state == terminated:
+                    n_term += 1
+                    if retval != 0:
+                        n_failed += 1
+                        counts[prefix][1] += 1
+                if used >= 0:
+                    mem.append(used)
+                    if alloc >= 0 and used > alloc:
+                        n_exceeded += 1
+                        counts[prefix][2] += 1
+            max_mem = max(mem) if mem else 0
+            edges = [0] + [2**k for k in range(max_mem.bit_length() + 1)]
+            hist = [0] * (len(edges) - 1)
+            for used in mem:
+                hist[min(bisect.bisect_right(edges, used), len(hist)) - 1] += 1
+            per_prefix = counts
+
+        total = len(self)
+        print("%d failed (%.2f%% of %d terminated), %d exceeded memory, "
+              "%d not terminated (total: %d)"
+              % (n_failed, 100. * n_failed / n_term if n_term else 0, n_term,
+                 n_exceeded, total - n_term, total))
+        print("Memory used (MB):")
+        for low, high, count in zip(edges, edges[1:], hist):
+            if count:
+                print("  %7d - %7d: %d" % (low, high, count))
+        print("Per directory (jobs, failed, exceeded memory):")
+        for prefix, (count, n_fail, n_exc) in zip(prefixes, per_prefix):
+            print("  %s: %d, %d, %d" % (prefix, count, n_fail, n_exc))
+
+
+def export_logs(logfiles, outfile, ignore_errors=False):
+    """Save the state of each job to `outfile` and print aggregated stats."""
+    if not logfiles:
+        logfiles = (line.rstrip() for line in sys.stdin)
+
+    table = JobTable()
+    for logfile in logfiles:
+        try:
+            table.append(logfile, *termination_code(logfile))
+        except BaseException as err:
+            err.args += ("At %s" % logfile,)
+            if ignore_errors and not isinstance(err, KeyboardInterrupt):
+                logger.exception('Unknown error')
+                continue
+            else:
+                raise
+
+    table.save(outfile)
+    table.summary()
+
+
 def main():
     logging.basicConfig(format="%(levelname)s:%(message)s")
     parser = argparse.ArgumentParser(description=__doc__)
@@ -230,8 +404,18 @@ def main():
                         help='Sort by time')
     parser.add_argument('-i', '--ignore-errors', action='store_true',
                         help='Skip files that raise errors and continue')
+    parser.add_argument('-e', '--export', metavar='FILE',
+                        help=('Save one row per job to FILE (.npz, requires '
+                              'numpy, if FILE ends in .npz, CSV otherwise) '
+                              'and only print aggregated stats.'))
     args = parser.parse_args()
-    check_logs(**vars(args))
+    if args.export:
+        if args.export.endswith('.npz') and np is None:
+            parser.error('numpy is required to write a .npz file')
+        export_logs(args.logfiles, args.export, args.ignore_errors)
+    else:
+        del args.export
+        check_logs(**vars(args))
 
 
 if __name__=='__main__':
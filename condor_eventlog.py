@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+
+
+"""Streaming reader for HTCondor job event logs (the `log = ...` files).
+
+The log is read by chunks of CHUNK_SIZE bytes and split into events without
+creating one string per line: each `Event` only keeps its header match and the
+end offset of its text, which is parsed on demand (return value, memory table,
+image size). Lines outside an event that are not a valid header are ignored.
+
+    for event in read_events('job.condor.log'):
+        if event.name == 'terminated':
+            print(event.jobid, event.timestamp, event.return_value)
+"""
+
+from __future__ import print_function
+
+
+import re
+
+
+EVENT_NAMES = {'000': 'submitted',
+               '001': 'started',
+               '004': 'evicted',
+               '005': 'terminated',
+               '006': 'Image size updated',
+               '007': 'Shadow exception!',
+               '009': 'aborted',
+               '012': 'hold',
+               '013': 'released',
+               '022': 'disconnected',  # attempting to reconnect
+               '024': 'reconnection failed'}  # disconnected too long. rescheduling job
+_NAMES = dict((code.encode('ascii'), name) for code, name in EVENT_NAMES.items())
+
+# Event code, (cluster.process.subprocess), date (MM/DD hh:mm:ss or ISO).
+RE_HEADER = re.compile(br'(\d{3}) \((\d+\.\d+\.\d+)\) (\S+ \S+) ')
+# Body patterns are applied to the whole event text, so they must not cross lines.
+RE_RETURN = re.compile(br'\(([^()\n]+) (\d+)\)')
+RE_MEM = re.compile(br'^[ \t]*Memory \(MB\)[ \t]+:[ \t]*(\d+)[ \t]+(\d+)[ \t]+(\d+)[ \t\r]*$',
+                    re.M)
+RE_IMAGESIZE = re.compile(br'Image size of job updated: (\d+)')
+RE_MEMUPDATE = re.compile(br'^[ \t]*(\d+)[ \t]+-[ \t]+MemoryUsage of job \([A-Za-z]+\)[ \t\r]*$',
+                          re.M)
+
+SEPARATOR = b'\n...'
+CHUNK_SIZE = 1 << 14
+
+
+class Event(object):
+    """One log event. Its text is only parsed when a property is accessed."""
+
+    __slots__ = ('_header', '_end')
+
+    def __init__(self, header, end):
+        self._header = header  # Match of RE_HEADER in the buffer.
+        self._end = end
+
+    def __repr__(self):
+        return '<Event %s (%s) %s>' % (self.code, self.jobid, self.timestamp)
+
+    @property
+    def code(self):
+        return self._header.group(1).decode('ascii')
+
+    @property
+    def jobid(self):
+        return self._header.group(2).decode('ascii')
+
+    @property
+    def timestamp(self):
+        return self._header.group(3).decode('ascii')
+
+    @property
+    def name(self):
+        """Name of the event, or None if the code is not in EVENT_NAMES."""
+        return _NAMES.get(self._header.group(1))
+
+    @property
+    def text(self):
+        """Full text of the event, header line included."""
+        header = self._header
+        return header.string[header.start():self._end].decode('utf-8', 'replace')
+
+    def _search(self, regex):
+        header = self._header
+        return regex.search(header.string, header.start(), self._end)
+
+    @property
+    def return_value(self):
+        """(return_type, value), e.g. ('return value', 0) or ('signal', 9)."""
+        m = self._search(RE_RETURN)
+        if m:
+            return m.group(1).decode('ascii'), int(m.group(2))
+
+    @property
+    def memory(self):
+        """(usage, request, allocated) in MB, from the resources table."""
+        m = self._search(RE_MEM)
+        if m:
+            return tuple(int(x) for x in m.groups())
+
+    @property
+    def image_size(self):
+        """Image size (KB) of an 'Image size updated' event."""
+        m = self._search(RE_IMAGESIZE)
+        if m:
+            return int(m.group(1))
+
+    @property
+    def memory_usage(self):
+        """MemoryUsage (MB) of an 'Image size updated' event."""
+        m = self._search(RE_MEMUPDATE)
+        if m:
+            return int(m.group(1))
+
+
+def split_events(buf, eof=True):
+    """Return the events of `buf` (bytes) and the offset of the
+    unparsed rest.
+
+    If not `eof`, stop before an event or line that may continue in the next
+    chunk of the file."""
+    events = []
+    pos = 0
+    length = len(buf)
+    while pos < length:
+        header = RE_HEADER.match(buf, pos)
+        if not header:
+            # Not inside an event: skip the line.
+            eol = buf.find(b'\n', pos)
+            if eol < 0:
+                if not eof:
+                    break
+                pos = length
+            else:
+                pos = eol + 1
+            continue
+
+        sep = buf.find(SEPARATOR, header.end())
+        if sep < 0:
+            if not eof:
+                break
+            # Last event still being written.
+            end = next_pos = length
+        else:
+            end = sep
+            eol = buf.find(b'\n', sep + 1)
+            if eol < 0:
+                if not eof:
+                    break
+                next_pos = length
+            else:
+                next_pos = eol + 1
+
+        events.append(Event(header, end))
+        pos = next_pos
+    return events, pos
+
+
+def iter_events(buf):
+    """Yield the events of a log given as bytes."""
+    return iter(split_events(buf)[0])
+
+
+def read_events(logfile, chunk_size=CHUNK_SIZE):
+    """Yield the events of the log file at path `logfile`, reading it by
+    chunks of `chunk_size` bytes."""
+    with open(logfile, 'rb') as log:
+        rest = b''
+        while True:
+            chunk = log.read(chunk_size)
+            buf = rest + chunk if rest else chunk
+            events, pos = split_events(buf, eof=not chunk)
+            for event in events:
+                yield event
+            if not chunk:
+                return
+            rest = buf[pos:]